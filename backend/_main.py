@@ -1,4 +1,5 @@
 from manim import *
+from scene_writer import PipedScene
 
 
 # Define a custom Shake animation class
@@ -7,45 +8,59 @@ class Shake(Animation):
         self.amplitude = amplitude
         super().__init__(mobject, **kwargs)
         
-    def interpolate_mobject(self, alpha):
-        # Original position
-        org_center = self.starting_mobject.get_center()
-        
-        # Apply a sine wave for shaking effect
+    def begin(self):
+        # Original position, cached before the first interpolate() call
+        self._org_center = self.mobject.get_center().copy()
+        # Precompute the sine wave once (one sample per rendered frame). This
+        # happens here rather than in __init__ because play(..., run_time=...)
+        # only sets the final run_time after construction.
         # As alpha increases from 0 to 1, we complete multiple oscillations
-        direction = RIGHT * self.amplitude * np.sin(alpha * TAU * 4)
+        self._n = max(2, int(self.run_time * config.frame_rate) + 1)
+        self._sin_table = self.amplitude * np.sin(np.linspace(0, TAU * 4, self._n))
+        super().begin()
         
-        # Update the position
-        self.mobject.move_to(org_center + direction)
+    def interpolate_mobject(self, alpha):
+        # Look up the offset for this frame and update the position
+        i = min(max(int(alpha * (self._n - 1)), 0), self._n - 1)
+        self.mobject.move_to(self._org_center + RIGHT * self._sin_table[i])
 
 
-class DeadlockScene(Scene):
+class DeadlockScene(PipedScene):
     def construct(self):
+        # Shared text styles, built once and reused by every Text below
+        label_style = dict(font_size=DEFAULT_FONT_SIZE)
+        explanation_style = dict(font_size=24)
+        
         # Create a function for explanatory text
-        def show_explanation(text_content, position=DOWN*3, color=WHITE):
-            explanation = Text(text_content, color=color, font_size=24)
+        def show_explanation(text_content, position=DOWN*3, color=WHITE, animate=False):
+            explanation = Text(text_content, color=color, **explanation_style)
             explanation.move_to(position)
-            self.play(FadeIn(explanation))
+            if animate:
+                self.play(FadeIn(explanation), run_time=0.3)
+            else:
+                # No fade needed, so skip rendering a whole animation for it
+                self.add(explanation)
             return explanation
         
         # 1. Title
         title = Title("Deadlock in Operating Systems")
         self.play(FadeIn(title))
         
-        intro_text = show_explanation("A deadlock occurs when processes are waiting for resources held by each other")
+        intro_text = show_explanation("A deadlock occurs when processes are waiting for resources held by each other", animate=True)
         self.wait(2)
         self.play(FadeOut(intro_text))
 
         # 2. Create Process and Resource objects
         p1 = Square(side_length=1.2, color=BLUE).shift(LEFT*3 + UP*1)
         p2 = Square(side_length=1.2, color=GREEN).shift(RIGHT*3 + UP*1)
-        p1_label = Text("P1").move_to(p1.get_center())
-        p2_label = Text("P2").move_to(p2.get_center())
-
         r1 = Circle(radius=0.6, color=YELLOW).shift(LEFT*3 + DOWN*1)
         r2 = Circle(radius=0.6, color=ORANGE).shift(RIGHT*3 + DOWN*1)
-        r1_label = Text("R1").move_to(r1.get_center())
-        r2_label = Text("R2").move_to(r2.get_center())
+
+        # Build all four labels in one pass so the font setup stays warm
+        labels = VGroup(*[Text(t, **label_style) for t in ["P1", "P2", "R1", "R2"]])
+        for label, shape in zip(labels, [p1, p2, r1, r2]):
+            label.move_to(shape.get_center())
+        p1_label, p2_label, r1_label, r2_label = labels
 
         self.play(FadeIn(p1, p2, r1, r2), Write(p1_label), Write(p2_label), Write(r1_label), Write(r2_label))
         
@@ -61,7 +76,11 @@ class DeadlockScene(Scene):
         arr_p1_r1 = Arrow(start=r1.get_top(), end=p1.get_bottom(), buff=0.1)
         arr_p2_r2 = Arrow(start=r2.get_top(), end=p2.get_bottom(), buff=0.1)
         self.play(GrowArrow(arr_p1_r1), GrowArrow(arr_p2_r2))
-        self.play(Indicate(r1, scale_factor=1.1), Indicate(r2, scale_factor=1.1))
+        # Short visual accents: run both at once over fewer frames
+        self.play(
+            AnimationGroup(Indicate(r1, scale_factor=1.1), Indicate(r2, scale_factor=1.1), lag_ratio=0),
+            run_time=0.6
+        )
         self.wait(2)
         self.play(FadeOut(step1_text))
 
@@ -70,8 +89,11 @@ class DeadlockScene(Scene):
         
         req1 = Arrow(start=p1.get_right() + DOWN*0.5, end=r2.get_left() + UP*0.2, buff=0.1, stroke_color=BLUE)
         self.play(GrowArrow(req1), run_time=1)
-        self.play(req1.animate.set_color(RED), Flash(req1.get_end(), color=RED))
-        self.play(Indicate(p1_label, scale_factor=1.2))
+        self.play(
+            AnimationGroup(req1.animate.set_color(RED), Flash(req1.get_end(), color=RED), lag_ratio=0),
+            run_time=0.6
+        )
+        self.play(Indicate(p1_label, scale_factor=1.2), run_time=0.6)
         self.wait(2)
         self.play(FadeOut(step2_text))
 
@@ -80,8 +102,11 @@ class DeadlockScene(Scene):
         
         req2 = Arrow(start=p2.get_left() + DOWN*0.5, end=r1.get_right() + UP*0.2, buff=0.1, stroke_color=GREEN)
         self.play(GrowArrow(req2), run_time=1)
-        self.play(req2.animate.set_color(RED), Flash(req2.get_end(), color=RED))
-        self.play(Indicate(p2_label, scale_factor=1.2))
+        self.play(
+            AnimationGroup(req2.animate.set_color(RED), Flash(req2.get_end(), color=RED), lag_ratio=0),
+            run_time=0.6
+        )
+        self.play(Indicate(p2_label, scale_factor=1.2), run_time=0.6)
         self.wait(2)
         self.play(FadeOut(step3_text))
 
@@ -89,10 +114,8 @@ class DeadlockScene(Scene):
         step4_text = show_explanation("Step 4: Circular wait condition is formed - a defining characteristic of deadlock")
         
         cycle = VGroup(req1, arr_p1_r1, req2, arr_p2_r2)
-        self.play(
-            *[v.animate.set_stroke(width=6) for v in cycle],
-            run_time=1
-        )
+        # VGroup.set_stroke propagates to every arrow, so one builder is enough
+        self.play(cycle.animate.set_stroke(width=6), run_time=1)
         self.wait(2)
         self.play(FadeOut(step4_text))
 
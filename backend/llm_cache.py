@@ -0,0 +1,133 @@
+"""
+Semantic cache for generated Manim code.
+
+Prompts are looked up by an exact SHA-256 match first, then by cosine
+similarity of their embeddings. Embeddings need the optional
+sentence-transformers package; without it only exact matches are served.
+"""
+import hashlib
+import logging
+import threading
+import time
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SIMILARITY_THRESHOLD = 0.92
+CACHE_TTL_SECONDS = 24 * 60 * 60
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def embed(text: str) -> Optional[np.ndarray]:
+    """Return a unit-norm embedding of `text`, or None if no embedding model is available"""
+    global _embedder
+    if SentenceTransformer is None:
+        return None
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = SentenceTransformer(EMBEDDING_MODEL)
+    return _embedder.encode(text, normalize_embeddings=True)
+
+
+class SemanticCache:
+    """
+    In-process cache of (manim_code, explanation) keyed by prompt.
+    Methods block on embedding computation, so call them via asyncio.to_thread.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl: float = CACHE_TTL_SECONDS,
+        maxsize: int = 1024,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # key -> (expires_at, manim_code, explanation)
+        self._entries: Dict[str, Tuple[float, str, str]] = {}
+        # Parallel lists backing the nearest-neighbour search
+        self._keys: List[str] = []
+        self._embeddings: List[np.ndarray] = []
+
+    @staticmethod
+    def key(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode()).hexdigest()
+
+    def _evict(self, now: float) -> None:
+        expired = {k for k, (expires_at, _, _) in self._entries.items() if expires_at <= now}
+        # Drop the oldest entries once over capacity (dicts keep insertion order)
+        overflow = len(self._entries) - len(expired) - self.maxsize
+        if overflow > 0:
+            expired.update([k for k in self._entries if k not in expired][:overflow])
+        if not expired:
+            return
+        for k in expired:
+            del self._entries[k]
+        kept = [(k, e) for k, e in zip(self._keys, self._embeddings) if k not in expired]
+        self._keys = [k for k, _ in kept]
+        self._embeddings = [e for _, e in kept]
+
+    def lookup(self, prompt: str) -> Optional[Tuple[str, str]]:
+        """Return cached (manim_code, explanation) for the prompt or a near-identical one"""
+        try:
+            return self._lookup(prompt)
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed: %s", e)
+            return None
+
+    def store(self, prompt: str, manim_code: str, explanation: str) -> None:
+        """Cache the code generated (and successfully rendered) for a prompt"""
+        try:
+            self._store(prompt, manim_code, explanation)
+        except Exception as e:
+            logger.warning("Semantic cache update failed: %s", e)
+
+    def _lookup(self, prompt: str) -> Optional[Tuple[str, str]]:
+        key = self.key(prompt)
+        with self._lock:
+            self._evict(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry[1], entry[2]
+            if not self._keys:
+                return None
+
+        # Only pay for an embedding when there is no verbatim match
+        embedding = embed(prompt)
+        if embedding is None:
+            return None
+
+        with self._lock:
+            if not self._keys:
+                return None
+            similarities = np.stack(self._embeddings) @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            entry = self._entries[self._keys[best]]
+            return entry[1], entry[2]
+
+    def _store(self, prompt: str, manim_code: str, explanation: str) -> None:
+        key = self.key(prompt)
+        embedding = embed(prompt)
+        with self._lock:
+            now = time.monotonic()
+            if key not in self._entries and embedding is not None:
+                self._keys.append(key)
+                self._embeddings.append(embedding)
+            self._entries[key] = (now + self.ttl, manim_code, explanation)
+            self._evict(now)
+
+
+semantic_cache = SemanticCache()
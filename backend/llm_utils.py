@@ -1,41 +1,196 @@
-from openai import OpenAI
+import openai
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from supabase import Client
+from collections import OrderedDict
+from functools import lru_cache
+import ast
+import asyncio
+import hashlib
+import httpx
+import json
+import logging
 import os
 import re
-from typing import Optional, Tuple
+import sys
+from typing import Any, Dict, List, Optional, Pattern, Tuple
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 token = os.environ["GITHUB_TOKEN"]
 endpoint = "https://models.github.ai/inference"
 model = "openai/gpt-4o-mini"
 
-client = OpenAI(
+# One pooled keep-alive HTTP/2 connection set shared by every request
+client = AsyncOpenAI(
     base_url=endpoint,
     api_key=token,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    ),
 )
 
+# API failures that are worth retrying after a delay. The generation helpers
+# re-raise these instead of falling back, so the caller can back off.
+TRANSIENT_LLM_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+# LLM response cache: Supabase table shared by all workers, fronted by a
+# small in-process LRU for rapid duplicate requests
+PROMPT_CACHE_TABLE = "prompt_cache"
+_LOCAL_CACHE_SIZE = 256
+_local_cache: "OrderedDict[str, str]" = OrderedDict()
+# Code generation and fix responses are only written to the cache once the
+# code they produced has rendered; until then they wait here, keyed by that code
+_unconfirmed: "OrderedDict[str, List[Tuple[str, str]]]" = OrderedDict()
+
+# Precompiled patterns, reused across calls
+_TAG_RE: Dict[str, Pattern[str]] = {}
+_FENCE_OPEN_RE = re.compile(r'^```(?:python)?\s*\n?', re.MULTILINE)
+_FENCE_CLOSE_RE = re.compile(r'\n?```\s*$', re.MULTILINE)
+_CLASS_RE = re.compile(r'class\s+(\w+)\s*\([^)]*Scene[^)]*\)')
+_VALIDATE_RE = re.compile(r'(from manim import|import manim|self\.play|self\.add)')
+
 def extract_content_from_tags(text: str, tag: str) -> Optional[str]:
     """Extract content between XML-like tags"""
-    pattern = f"<{tag}>(.*?)</{tag}>"
-    match = re.search(pattern, text, re.DOTALL)
+    pattern = _TAG_RE.get(tag)
+    if pattern is None:
+        pattern = _TAG_RE[tag] = re.compile(f"<{tag}>(.*?)</{tag}>", re.DOTALL)
+    match = pattern.search(text)
     return match.group(1).strip() if match else None
 
+async def stream_completion_until(stop_tag: str, **kwargs) -> str:
+    """
+    Stream a chat completion and stop reading as soon as `stop_tag` arrives.
+    Returns the text received so far.
+    """
+    stream = await client.chat.completions.create(stream=True, **kwargs)
+    pieces = []
+    tail = ""
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            piece = chunk.choices[0].delta.content or ""
+            pieces.append(piece)
+            # Only the last few characters can complete a tag split across chunks
+            window = tail + piece
+            if stop_tag in window:
+                break
+            tail = window[-len(stop_tag):]
+    finally:
+        await stream.close()
+    return "".join(pieces)
+
+def _cache_key(system_prompt: str, user_prompt: str, temperature: Optional[float] = None) -> str:
+    # Resume from the precomputed system prompt digest when there is one;
+    # the result equals sha256(system_prompt + user_prompt + model + temperature)
+    prefix = _SYSTEM_PROMPT_DIGESTS.get(system_prompt)
+    digest = prefix.copy() if prefix is not None else hashlib.sha256(system_prompt.encode())
+    digest.update(f"{user_prompt}{model}{temperature}".encode())
+    return digest.hexdigest()
+
+def _remember(key: str, response: str) -> None:
+    _local_cache[key] = response
+    _local_cache.move_to_end(key)
+    if len(_local_cache) > _LOCAL_CACHE_SIZE:
+        _local_cache.popitem(last=False)
+
+async def _cache_get(supabase: Optional[Client], key: str) -> Optional[str]:
+    if key in _local_cache:
+        _local_cache.move_to_end(key)
+        return _local_cache[key]
+    if supabase is None:
+        return None
+    try:
+        result = await asyncio.to_thread(
+            supabase.table(PROMPT_CACHE_TABLE).select("response").eq("key", key).limit(1).execute
+        )
+    except Exception as e:
+        logger.warning("Prompt cache lookup failed: %s", e)
+        return None
+    if not result.data:
+        return None
+    response = result.data[0]["response"]
+    _remember(key, response)
+    return response
+
+async def _cache_set(supabase: Optional[Client], key: str, response: str) -> None:
+    _remember(key, response)
+    if supabase is None:
+        return
+    try:
+        await asyncio.to_thread(
+            supabase.table(PROMPT_CACHE_TABLE).upsert({"key": key, "response": response}).execute
+        )
+    except Exception as e:
+        logger.warning("Prompt cache write failed: %s", e)
+
+async def cached_completion(
+    supabase: Optional[Client],
+    stop_tag: str,
+    system_prompt: str,
+    user_prompt: str,
+    pending: Optional[List[Tuple[str, str]]] = None,
+    **kwargs,
+) -> str:
+    """
+    Return the LLM response for (system_prompt, user_prompt, model), serving it
+    from the prompt cache when the same request was answered before.
+    With `pending`, a fresh response is appended to it as (key, response)
+    instead of being cached right away.
+    """
+    # Requests differing only in temperature get different answers, so
+    # the temperature is part of the key
+    key = _cache_key(system_prompt, user_prompt, kwargs.get("temperature"))
+    cached = await _cache_get(supabase, key)
+    if cached is not None:
+        logger.info("Returning cached LLM response")
+        return cached
+    
+    content = await stream_completion_until(
+        stop_tag,
+        model=model,
+        messages=[
+            _SYSTEM_MESSAGES.get(system_prompt) or {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        **kwargs,
+    )
+    if content and pending is not None:
+        pending.append((key, content))
+    elif content:
+        await _cache_set(supabase, key, content)
+    return content
+
+def _hold_until_rendered(code: str, responses: List[Tuple[str, str]]) -> None:
+    if not responses:
+        return
+    _unconfirmed[code] = responses
+    _unconfirmed.move_to_end(code)
+    if len(_unconfirmed) > _LOCAL_CACHE_SIZE:
+        _unconfirmed.popitem(last=False)
+
+async def confirm_rendered_code(supabase: Optional[Client], code: str) -> None:
+    """Cache the LLM responses that produced `code`, now that it has rendered"""
+    for key, response in _unconfirmed.pop(code, ()):
+        await _cache_set(supabase, key, response)
+
 def clean_code_block(code: str) -> str:
     """Remove markdown code fences and clean up code"""
     # Remove markdown fences
-    code = re.sub(r'^```(?:python)?\s*\n?', '', code, flags=re.MULTILINE)
-    code = re.sub(r'\n?```\s*$', '', code, flags=re.MULTILINE)
+    code = _FENCE_OPEN_RE.sub('', code)
+    code = _FENCE_CLOSE_RE.sub('', code)
     
     # Remove extra whitespace but preserve indentation
-    lines = code.split('\n')
-    # Remove empty lines at start and end
-    while lines and not lines[0].strip():
-        lines.pop(0)
-    while lines and not lines[-1].strip():
-        lines.pop()
+    lines = code.splitlines()
+    # Remove empty lines at start and end with a single slice
+    start = next((i for i, line in enumerate(lines) if line.strip()), len(lines))
+    end = len(lines) - next((i for i, line in enumerate(reversed(lines)) if line.strip()), 0)
     
-    return '\n'.join(lines)
+    return '\n'.join(lines[start:end])
 
 
 _XML_TAG_CLOSURE_INSTRUCTION = (
@@ -100,6 +255,49 @@ Format your response EXACTLY as:
 
 """
 
+COMBINED_GENERATION_SYSTEM = f"""You are a Manim visualization expert and an expert Manim developer. In a single response, first enhance the user's prompt for an educational mathematical or scientific animation, then generate clean, working Python code for it.
+
+When enhancing the prompt:
+1. Add mathematical context and educational value
+2. Suggest appropriate Manim objects and animations
+3. Specify visual elements like colors, positioning, and timing
+4. Include relevant mathematical concepts and formulas
+5. Ensure the animation tells a clear story
+
+CRITICAL CODE REQUIREMENTS:
+1. Always use the class name "GeneratedScene" that inherits from Scene
+2. Implement the construct() method
+3. Use proper Manim imports (from manim import *)
+4. Follow Manim best practices for animations
+5. Include comments explaining key steps
+6. Use appropriate wait() calls between animations
+7. Ensure all objects are properly positioned and styled
+8. Implement the enhanced prompt, not just the original one
+
+Common Manim objects to use:
+- Text, MathTex, Tex for text and formulas
+- Circle, Square, Rectangle, Line for shapes
+- NumberPlane, Axes for coordinate systems
+- VGroup for grouping objects
+- Transform, FadeIn, FadeOut, Create, Write for animations
+
+Format your response EXACTLY as, in this order:
+<enhanced_prompt>
+[Your enhanced prompt here]
+</enhanced_prompt>
+
+<manim_code>
+[Your complete Python code here]
+</manim_code>
+
+<explanation>
+[Brief explanation of what the animation does]
+</explanation>
+
+{_XML_TAG_CLOSURE_INSTRUCTION}
+
+"""
+
 ERROR_FIXING_SYSTEM = f"""You are a Manim debugging expert. Fix Python Manim code based on error messages.
 
 CRITICAL REQUIREMENTS:
@@ -130,43 +328,120 @@ Format your response EXACTLY as:
 
 """
 
-def enhance_prompt_and_generate_code(prompt: str) -> Tuple[str, str]:
+PROGRAM_TEMPLATE_SYSTEM = f"""You are an expert Manim developer. You will be shown several user prompts that differ only in their parameters, together with working Manim code written for each of them. Write ONE parameterized Manim program that covers all of them.
+
+CRITICAL REQUIREMENTS:
+1. Always use the class name "GeneratedScene" that inherits from Scene
+2. Use proper Manim imports (from manim import *)
+3. Define every value that varies between the prompts in a single dict on ONE line, directly after the imports: PARAMS = {{"name": default_value, ...}}
+4. PARAMS values must be JSON-compatible literals (strings, numbers, booleans, lists)
+5. Read the parameters only through PARAMS["name"] in the rest of the code
+6. Keep everything that is common to the examples unchanged
+
+Format your response EXACTLY as:
+<program_template>
+[Your complete parameterized Python code here]
+</program_template>
+
+{_XML_TAG_CLOSURE_INSTRUCTION}
+
+"""
+
+PARAM_EXTRACTION_SYSTEM = f"""You extract parameter values from a user prompt for an existing Manim program.
+
+You will be given a JSON object of parameter names with example values, and a user prompt. Return a JSON object with the same keys and values of the same types, taken from the prompt. Keep the example value for any parameter the prompt does not mention.
+
+Format your response EXACTLY as:
+<params>
+[JSON object]
+</params>
+
+{_XML_TAG_CLOSURE_INSTRUCTION}
+
+"""
+
+# System messages and cache-key digest prefixes, built once at import
+# instead of per request
+_SYSTEM_MESSAGES = {
+    prompt: {"role": "system", "content": sys.intern(prompt)}
+    for prompt in (
+        PROMPT_ENHANCEMENT_SYSTEM,
+        MANIM_CODE_GENERATION_SYSTEM,
+        COMBINED_GENERATION_SYSTEM,
+        ERROR_FIXING_SYSTEM,
+        PROGRAM_TEMPLATE_SYSTEM,
+        PARAM_EXTRACTION_SYSTEM,
+    )
+}
+_SYSTEM_PROMPT_DIGESTS = {prompt: hashlib.sha256(prompt.encode()) for prompt in _SYSTEM_MESSAGES}
+
+async def _enhance_then_generate(
+    prompt: str,
+    supabase: Optional[Client] = None,
+    pending: Optional[List[Tuple[str, str]]] = None,
+) -> str:
+    """
+    Two-call path: enhance the prompt, then generate code from it.
+    Returns the raw code generation response.
+    """
+    # Step 1: Enhance the prompt
+    enhanced_content = await cached_completion(
+        supabase,
+        "</enhanced_prompt>",
+        PROMPT_ENHANCEMENT_SYSTEM,
+        f"Enhance this prompt for creating an educational animation: {prompt}",
+        pending,
+        max_tokens=800,
+        temperature=0.7,
+    )
+    
+    enhanced_prompt = extract_content_from_tags(enhanced_content, "enhanced_prompt")
+    
+    if not enhanced_prompt:
+        enhanced_prompt = prompt  # Fallback to original
+    
+    logger.info("Enhanced prompt: %s", enhanced_prompt)
+    
+    # Step 2: Generate Manim code from enhanced prompt
+    return await cached_completion(
+        supabase,
+        "</manim_code>",
+        MANIM_CODE_GENERATION_SYSTEM,
+        f"Create a Manim animation for: {enhanced_prompt}",
+        pending,
+        temperature=0.3,  # Lower temperature for more consistent code
+    )
+
+async def enhance_prompt_and_generate_code(prompt: str, supabase: Optional[Client] = None) -> Tuple[str, str]:
     """
     Enhance the user prompt and generate Manim code.
     Returns: (manim_code, explanation)
     """
+    # Responses are cached only if the code renders (see confirm_rendered_code)
+    pending: List[Tuple[str, str]] = []
     try:
-        # Step 1: Enhance the prompt
-        enhanced_resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": PROMPT_ENHANCEMENT_SYSTEM},
-                {"role": "user", "content": f"Enhance this prompt for creating an educational animation: {prompt}"}
-            ],
-            max_tokens=800,
-            temperature=0.7,
+        # Enhance the prompt and generate code in a single round trip
+        code_content = await cached_completion(
+            supabase,
+            "</manim_code>",
+            COMBINED_GENERATION_SYSTEM,
+            f"Create an educational Manim animation for: {prompt}",
+            pending,
+            max_tokens=2500,
+            temperature=0.4,
         )
         
-        enhanced_content = enhanced_resp.choices[0].message.content or ""
-        enhanced_prompt = extract_content_from_tags(enhanced_content, "enhanced_prompt")
-        
-        if not enhanced_prompt:
-            enhanced_prompt = prompt  # Fallback to original
-        
-        print(f"Enhanced prompt: {enhanced_prompt}")
+        manim_code = extract_content_from_tags(code_content, "manim_code")
         
-        # Step 2: Generate Manim code from enhanced prompt
-        code_resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": MANIM_CODE_GENERATION_SYSTEM},
-                {"role": "user", "content": f"Create a Manim animation for: {enhanced_prompt}"}
-            ],
-            temperature=0.3,  # Lower temperature for more consistent code
-        )
+        if manim_code:
+            enhanced_prompt = extract_content_from_tags(code_content, "enhanced_prompt")
+            if enhanced_prompt:
+                logger.info("Enhanced prompt: %s", enhanced_prompt)
+        else:
+            # Fallback: separate enhancement and code generation calls
+            code_content = await _enhance_then_generate(prompt, supabase, pending)
+            manim_code = extract_content_from_tags(code_content, "manim_code")
         
-        code_content = code_resp.choices[0].message.content or ""
-        manim_code = extract_content_from_tags(code_content, "manim_code")
         explanation = extract_content_from_tags(code_content, "explanation") or "Animation generated"
         
         if not manim_code:
@@ -179,15 +454,24 @@ def enhance_prompt_and_generate_code(prompt: str) -> Tuple[str, str]:
         if "class GeneratedScene" not in manim_code:
             manim_code = add_scene_wrapper(manim_code)
         
+        _hold_until_rendered(manim_code, pending)
         return manim_code, explanation
         
+    except TRANSIENT_LLM_ERRORS:
+        raise
     except Exception as e:
-        print(f"Error in prompt enhancement/code generation: {e}")
+        logger.error("Error in prompt enhancement/code generation: %s", e)
         # Return a basic fallback
         fallback_code = generate_fallback_code(prompt)
         return fallback_code, "Fallback animation due to generation error"
 
-def fix_manim_code_with_error(raw_code: str, error_message: str, attempt_number: int = 1) -> Tuple[str, str]:
+async def fix_manim_code_with_error(
+    raw_code: str,
+    error_message: str,
+    attempt_number: int = 1,
+    supabase: Optional[Client] = None,
+    temperature: float = 0.1,
+) -> Tuple[str, str]:
     """
     Fix Manim code based on error message.
     Returns: (fixed_code, fix_explanation)
@@ -210,17 +494,17 @@ ERROR MESSAGE:
 Please analyze the error and provide a complete fixed version of the code.
 """
         
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": ERROR_FIXING_SYSTEM},
-                {"role": "user", "content": error_context}
-            ],
+        pending: List[Tuple[str, str]] = []
+        fix_content = await cached_completion(
+            supabase,
+            "</fixed_code>",
+            ERROR_FIXING_SYSTEM,
+            error_context,
+            pending,
             max_tokens=2000,
-            temperature=0.1,  # Very low temperature for consistent fixes
+            temperature=temperature,  # Low by default for consistent fixes
         )
         
-        fix_content = resp.choices[0].message.content or ""
         fixed_code = extract_content_from_tags(fix_content, "fixed_code")
         fix_explanation = extract_content_from_tags(fix_content, "fix_explanation") or "Code fixed"
         
@@ -234,13 +518,63 @@ Please analyze the error and provide a complete fixed version of the code.
         if "class GeneratedScene" not in fixed_code:
             fixed_code = add_scene_wrapper(fixed_code)
         
+        # A fix is only worth replaying if it renders
+        _hold_until_rendered(fixed_code, pending)
         return fixed_code, fix_explanation
         
+    except TRANSIENT_LLM_ERRORS:
+        raise
     except Exception as e:
-        print(f"Error in code fixing: {e}")
+        logger.error("Error in code fixing: %s", e)
         # Return the original code with a basic fix attempt
         return raw_code, f"Unable to fix error: {str(e)}"
 
+async def generate_program_template(examples: List[Tuple[str, str]]) -> Optional[str]:
+    """
+    Generalize working (prompt, manim_code) examples into one program whose
+    varying values live in a single-line PARAMS dict.
+    Returns the template code, or None if the model did not produce one.
+    """
+    try:
+        examples_text = "\n\n".join(
+            f"PROMPT {i}: {prompt}\nCODE {i}:\n```python\n{code}\n```"
+            for i, (prompt, code) in enumerate(examples, 1)
+        )
+        content = await cached_completion(
+            None,
+            "</program_template>",
+            PROGRAM_TEMPLATE_SYSTEM,
+            examples_text,
+            max_tokens=2500,
+            temperature=0.2,
+        )
+        template = extract_content_from_tags(content, "program_template")
+        return clean_code_block(template) if template else None
+    except Exception as e:
+        logger.error("Error generating program template: %s", e)
+        return None
+
+async def extract_program_params(prompt: str, param_schema: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Extract values for a program template's parameters from a user prompt.
+    Returns None if the model's answer could not be parsed.
+    """
+    try:
+        content = await cached_completion(
+            None,
+            "</params>",
+            PARAM_EXTRACTION_SYSTEM,
+            f"PARAMETERS: {json.dumps(param_schema)}\n\nPROMPT: {prompt}",
+            max_tokens=300,
+            temperature=0.0,
+        )
+        params_text = extract_content_from_tags(content, "params")
+        params = json.loads(params_text) if params_text else None
+        return params if isinstance(params, dict) else None
+    except Exception as e:
+        logger.error("Error extracting program parameters: %s", e)
+        return None
+
 def add_scene_wrapper(code_content: str) -> str:
     """Add proper Scene class wrapper if missing"""
     wrapper = f"""from manim import *
@@ -268,29 +602,56 @@ class GeneratedScene(Scene):
         self.wait(2)
 """
 
+@lru_cache(maxsize=128)
 def extract_scene_name_from_code(code: str) -> str:
     """Extract the scene class name from Manim code"""
     # Look for class definition
-    class_pattern = r'class\s+(\w+)\s*\([^)]*Scene[^)]*\)'
-    match = re.search(class_pattern, code)
+    match = _CLASS_RE.search(code)
     return match.group(1) if match else "GeneratedScene"
 
 # Additional utility function for validation
-def validate_manim_code(code: str) -> Tuple[bool, str]:
-    """Basic validation of Manim code structure"""
+# (memoized: retry attempts often validate the same code again)
+@lru_cache(maxsize=128)
+def validate_manim_code(code: str) -> Tuple[bool, str, str]:
+    """
+    Basic validation of Manim code structure.
+    Returns (is_valid, severity, message) where severity is "ok", "warn", or
+    "fatal". Only code that does not parse is fatal and should not be handed
+    to manim; the structural checks miss scenes built through intermediate
+    base classes or mixins, so they only warn.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return False, "fatal", f"Syntax error on line {e.lineno}: {e.msg}"
+
     issues = []
-    
-    if "from manim import" not in code and "import manim" not in code:
-        issues.append("Missing Manim imports")
-    
-    if "class" not in code:
+    classes = [node for node in tree.body if isinstance(node, ast.ClassDef)]
+    if not any(_base_name(base).endswith("Scene") for node in classes for base in node.bases):
         issues.append("Missing Scene class definition")
-    
-    if "def construct(self)" not in code:
+    if not any(
+        isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name == "construct"
+        for node in classes for item in node.body
+    ):
         issues.append("Missing construct method")
+
+    # Collect the remaining markers in a single scan of the code
+    found = {m.group(1) for m in _VALIDATE_RE.finditer(code)}
+    
+    if "from manim import" not in found and "import manim" not in found:
+        issues.append("Missing Manim imports")
     
-    if "self.play" not in code and "self.add" not in code:
+    if "self.play" not in found and "self.add" not in found:
         issues.append("No animations or objects added to scene")
     
-    is_valid = len(issues) == 0
-    return is_valid, "; ".join(issues) if issues else "Code structure looks good"
\ No newline at end of file
+    if issues:
+        return False, "warn", "; ".join(issues)
+    return True, "ok", "Code structure looks good"
+
+def _base_name(node: ast.expr) -> str:
+    """Name of a class base, e.g. "Scene" for both Scene and manim.Scene"""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return ""
\ No newline at end of file
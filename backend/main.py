@@ -1,9 +1,14 @@
 from fastapi import FastAPI, BackgroundTasks, HTTPException
-from typing import Optional
+from fastapi.responses import ORJSONResponse
+from typing import Dict, Optional
 from pydantic import BaseModel
 from manim_renderer import render_and_upload_video, get_video_info
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from cachetools import TTLCache
+import asyncio
+import secrets
+import time
 import uuid
 import os
 import logging
@@ -12,7 +17,7 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Manim Video Generator API", version="1.0.0")
+app = FastAPI(title="Manim Video Generator API", version="1.0.0", default_response_class=ORJSONResponse)
 
 load_dotenv()
 
@@ -23,7 +28,77 @@ SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY environment variables")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Created once per worker process on startup (see init_supabase)
+supabase: Client = None # type: ignore
+
+# Short-lived cache of in-progress task lookups so bursts of status polls
+# share one Supabase query. Per-task locks keep concurrent pollers from all
+# missing the cache at once; each lock is kept alongside the number of
+# pollers holding or waiting on it and dropped when that reaches zero.
+_status_cache: TTLCache = TTLCache(maxsize=4096, ttl=0.5)
+_status_locks: Dict[str, list] = {}  # task_id -> [lock, pollers]
+
+# Tasks this process issued whose database row is not written yet, mapped to
+# the video info a status poll should see: queued until the insert lands, or
+# failed if the insert did
+_unsaved_tasks: TTLCache = TTLCache(maxsize=4096, ttl=3600)
+
+# That map only covers this worker. Task ids are time-based (uuid1 with a
+# random node instead of the MAC address), so any worker can tell that a
+# task without a row was issued moments ago and report it as queued.
+QUEUED_GRACE_SECONDS = 60.0
+_UUID1_EPOCH_OFFSET = 0x01B21DD213814000  # 100ns intervals from 1582-10-15 to 1970-01-01
+
+def new_task_id() -> str:
+    """Time-based task id; the multicast bit marks the node as random"""
+    return str(uuid.uuid1(node=secrets.randbits(48) | (1 << 40)))
+
+def _issued_recently(task_id: str) -> bool:
+    task_uuid = uuid.UUID(task_id)
+    if task_uuid.version != 1:
+        return False
+    age = time.time() - (task_uuid.time - _UUID1_EPOCH_OFFSET) / 1e7
+    # Tolerate a little clock skew between workers
+    return -5.0 < age < QUEUED_GRACE_SECONDS
+
+def _queued_if_recent(task_id: str, video_info: dict) -> dict:
+    """Report a missing task as queued while its row may still be on its way"""
+    if video_info.get("status") == "not_found" and _issued_recently(task_id):
+        return {"task_id": task_id, "status": "queued"}
+    return video_info
+
+async def get_video_info_cached(task_id: str) -> dict:
+    """Get video info for a task, reusing a lookup made in the last 500ms"""
+    video_info = _unsaved_tasks.get(task_id) or _status_cache.get(task_id)
+    if video_info is not None:
+        return video_info
+    
+    entry = _status_locks.get(task_id)
+    if entry is None:
+        entry = _status_locks[task_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            video_info = _status_cache.get(task_id)
+            if video_info is not None:
+                return video_info
+            
+            video_info = _queued_if_recent(
+                task_id, await asyncio.to_thread(get_video_info, task_id, supabase)
+            )
+            # Only cache tasks that are still running; terminal states,
+            # missing tasks and lookup errors are always read fresh
+            if video_info.get("status") in ("queued", "processing"):
+                _status_cache[task_id] = video_info
+            else:
+                _status_cache.pop(task_id, None)
+            return video_info
+    finally:
+        # lock.locked() is already False before the next waiter resumes,
+        # so only the waiter count says whether anyone still needs the lock
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _status_locks[task_id]
 
 class PromptRequest(BaseModel):
     prompt: str
@@ -43,6 +118,12 @@ class VideoStatusResponse(BaseModel):
     attempts: Optional[int] = None
     progress: str
 
+@app.on_event("startup")
+async def init_supabase():
+    """Create this worker's Supabase client after the process has started"""
+    global supabase
+    supabase = create_client(SUPABASE_URL, SUPABASE_KEY) # type: ignore
+
 @app.get("/")
 async def root():
     return {
@@ -63,9 +144,35 @@ async def health_check():
         result = supabase.table("videos").select("count").limit(1).execute()
         return {"status": "healthy", "supabase": "connected"}
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
+        logger.error("Health check failed: %s", e)
         return {"status": "unhealthy", "error": str(e)}
 
+async def _init_then_render(prompt: str, supabase: Client, task_id: str, max_retries: int, quality: str):
+    """
+    Initialize the database record for a task, then render and upload its video.
+    Runs as a background task so the insert stays off the request path.
+    """
+    try:
+        await asyncio.to_thread(supabase.table("videos").insert({
+            "task_id": task_id,
+            "prompt": prompt,
+            "status": "queued",
+            "quality": quality,
+            "max_retries": max_retries,
+            "video_url": None
+        }).execute)
+    except Exception as e:
+        logger.error("Failed to create database record for task %s: %s", task_id, e)
+        _unsaved_tasks[task_id] = {
+            "task_id": task_id,
+            "status": "failed",
+            "error_message": f"Failed to create the task record: {e}",
+        }
+        return
+    _unsaved_tasks.pop(task_id, None)
+    
+    await render_and_upload_video(prompt, supabase, task_id, max_retries)
+
 @app.post("/generate-video/", response_model=VideoResponse)
 async def generate_video(request: PromptRequest, background_tasks: BackgroundTasks):
     """
@@ -80,27 +187,21 @@ async def generate_video(request: PromptRequest, background_tasks: BackgroundTas
             raise HTTPException(status_code=400, detail="max_retries must be between 1 and 10")
         
         # Generate unique task ID
-        task_id = str(uuid.uuid4())
+        task_id = new_task_id()
         
-        logger.info(f"Starting video generation for task {task_id} with prompt: {request.prompt[:100]}...")
+        logger.info("Starting video generation for task %s with prompt: %.100s...", task_id, request.prompt)
         
-        # Initialize database record
-        supabase.table("videos").insert({
-            "task_id": task_id,
-            "prompt": request.prompt,
-            "status": "queued",
-            "quality": request.quality,
-            "max_retries": request.max_retries,
-            "video_url": None
-        }).execute()
+        # Polls may arrive before the background task has written the row
+        _unsaved_tasks[task_id] = {"task_id": task_id, "status": "queued"}
         
-        # Start background task
+        # Start background task (creates the database record, then renders)
         background_tasks.add_task(
-            render_and_upload_video, 
+            _init_then_render, 
             request.prompt, 
             supabase, 
             task_id, 
-            request.max_retries
+            request.max_retries,
+            request.quality
         )
         
         # Estimate completion time based on quality
@@ -120,7 +221,7 @@ async def generate_video(request: PromptRequest, background_tasks: BackgroundTas
         raise
     except Exception as e:
         print(e)
-        logger.error(f"Error starting video generation: {e}")
+        logger.error("Error starting video generation: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/video-status/{task_id}", response_model=VideoStatusResponse)
@@ -135,8 +236,8 @@ async def get_video_status(task_id: str):
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid task_id format")
         
-        # Get video info from database
-        video_info = get_video_info(task_id, supabase)
+        # Get video info from database (coalesced across concurrent polls)
+        video_info = await get_video_info_cached(task_id)
         
         if video_info.get("status") == "not_found":
             raise HTTPException(status_code=404, detail="Task not found")
@@ -162,7 +263,7 @@ async def get_video_status(task_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting video status: {e}")
+        logger.error("Error getting video status: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/video-info/{task_id}")
@@ -177,7 +278,7 @@ async def get_detailed_video_info(task_id: str):
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid task_id format")
         
-        video_info = get_video_info(task_id, supabase)
+        video_info = _unsaved_tasks.get(task_id) or _queued_if_recent(task_id, get_video_info(task_id, supabase))
         
         if video_info.get("status") == "not_found":
             raise HTTPException(status_code=404, detail="Task not found")
@@ -201,7 +302,7 @@ async def get_detailed_video_info(task_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting detailed video info: {e}")
+        logger.error("Error getting detailed video info: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # Legacy endpoint for backward compatibility
@@ -234,4 +335,15 @@ def get_completed_videos():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
+    # Workers inherit this, so each one sizes its render semaphore to its
+    # share of the cores (see RENDER_SEMAPHORE in manim_renderer)
+    workers = int(os.environ.setdefault("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        log_level="info"
+    )
\ No newline at end of file
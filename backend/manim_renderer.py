@@ -1,242 +1,421 @@
+import ast
+import asyncio
+import base64
+import hashlib
+import random
+import shlex
+from pathlib import Path
+from typing import Optional, Tuple
 import tempfile
 import subprocess
 import os
+import time
 import traceback
+import httpx
 from supabase import Client
 from llm_utils import (
+    TRANSIENT_LLM_ERRORS,
+    confirm_rendered_code,
     enhance_prompt_and_generate_code, 
     fix_manim_code_with_error,
     extract_scene_name_from_code,
     validate_manim_code
 )
+from llm_cache import semantic_cache
+from program_cache import program_cache
+from template_library import template_library
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the application entry point (main.py)
 logger = logging.getLogger(__name__)
 
-# def render_and_upload_video(prompt: str, supabase: Client, task_id: str, max_retries: int = 5):
-#     """
-#     Enhanced video rendering with better error handling and structured LLM communication
-#     """
-#     last_error = None
-#     manim_code = None
-#     fix_explanation = ""
-    
-#     try:
-#         # Update status to processing
-#         supabase.table("videos").upsert({
-#             "task_id": task_id,
-#             "status": "processing",
-#             "video_url": None
-#         }).execute()
-        
-#         for attempt in range(1, max_retries + 1):
-#             logger.info(f"Attempt {attempt}/{max_retries} for task {task_id}")
-            
-#             try:
-#                 # Generate or fix Manim code
-#                 if attempt == 1:
-#                     logger.info("Generating initial Manim code...")
-#                     manim_code, explanation = enhance_prompt_and_generate_code(prompt)
-#                     logger.info(f"Code generation explanation: {explanation}")
-#                 else:
-#                     logger.info(f"Fixing code based on error from attempt {attempt-1}...")
-#                     # Create detailed error message for LLM
-#                     error_details = format_error_for_llm(last_error, manim_code)
-#                     manim_code, fix_explanation = fix_manim_code_with_error(
-#                         manim_code or "", 
-#                         error_details, 
-#                         attempt
-#                     )
-#                     logger.info(f"Fix explanation: {fix_explanation}")
-                
-#                 # Validate code structure before attempting to render
-#                 is_valid, validation_msg = validate_manim_code(manim_code)
-#                 if not is_valid:
-#                     logger.warning(f"Code validation failed: {validation_msg}")
-#                     # Continue anyway, but log the warning
-                
-#                 logger.info(f"Generated/Fixed Manim code:\n{manim_code[:500]}...")
-                
-#                 # Attempt to render the video
-#                 video_path = render_manim_video(manim_code, task_id)
-                
-#                 # If we get here, rendering was successful
-#                 logger.info("Manim rendering successful!")
-                
-#                 # Upload to Supabase
-#                 public_url = upload_video_to_supabase(video_path, task_id, supabase)
-                
-#                 # Update database with success
-#                 supabase.table("videos").upsert({
-#                     "task_id": task_id,
-#                     "video_url": public_url,
-#                     "status": "completed",
-#                     "attempts": attempt,
-#                     "final_code": manim_code
-#                 }).execute()
-                
-#                 logger.info(f"Video successfully uploaded: {public_url}")
-#                 return public_url
-                
-#             except subprocess.CalledProcessError as e:
-#                 last_error = e
-#                 stderr_output = e.stderr if isinstance(e.stderr, str) else e.stderr.decode()
-#                 error_msg = f"Manim subprocess error: {stderr_output}"
-#                 logger.error(f"Attempt {attempt} failed with subprocess error: {error_msg}")
-                
-#                 if attempt == max_retries:
-#                     raise Exception(f"Failed to render after {max_retries} attempts. Last error: {error_msg}")
-                    
-#             except Exception as e:
-#                 last_error = e
-#                 logger.error(f"Attempt {attempt} failed with error: {str(e)}")
-                
-#                 if attempt == max_retries:
-#                     raise Exception(f"Failed to render after {max_retries} attempts. Last error: {str(e)}")
-    
-#     except Exception as e:
-#         logger.error(f"Fatal error in render_and_upload_video: {str(e)}")
-#         # Update database with error status
-#         supabase.table("videos").upsert({
-#             "task_id": task_id,
-#             "status": "failed",
-#             "error_message": str(e),
-#             "video_url": None
-#         }).execute()
-#         raise
+# Backoff between attempts that failed on a transient API error. A task
+# that has been running longer than MAX_RETRY_TIME (renders included) gives
+# up instead of backing off again.
+RETRY_BASE_DELAY = 2.0
+RETRY_MAX_DELAY = 60.0
+MAX_RETRY_TIME = 600.0
 
+# How often buffered in-progress task status is written to the database
+STATUS_FLUSH_INTERVAL = 5.0
 
-import logging
-import subprocess
-from typing import Tuple
-from supabase import Client
+# Manim output kept for logging and error reports
+OUTPUT_TAIL_BYTES = 256 << 10
+STREAM_CHUNK_SIZE = 64 << 10
 
-# Assume client, models, system prompts, and other helper functions are defined elsewhere
-# (e.g., render_manim_video, upload_video_to_supabase, validate_manim_code, etc.)
-logger = logging.getLogger(__name__)
+# Bound on concurrent manim processes in this server process. The semaphore
+# is per process, so by default the cores are split across the server's
+# worker processes (WEB_CONCURRENCY, which uvicorn also reads for --workers).
+# MANIM_CONCURRENCY overrides the per-process limit.
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+RENDER_SEMAPHORE = asyncio.Semaphore(int(os.environ.get(
+    "MANIM_CONCURRENCY", max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+)))
+
+# Resumable uploads: Supabase requires 6MB chunks (except the last one)
+UPLOAD_CHUNK_SIZE = 6 << 20
+UPLOAD_CHUNK_RETRIES = 3
+UPLOAD_CLIENT = httpx.Client(http2=True, timeout=httpx.Timeout(60.0, connect=10.0))
+
+# Trade tokens for latency: request one fix per temperature in parallel and
+# keep the best one, instead of a single fix per attempt
+SPECULATIVE_FIX = os.environ.get("SPECULATIVE_FIX", "").lower() in ("1", "true", "yes")
+SPECULATIVE_FIX_TEMPERATURES = (0.0, 0.7)
+# Retried once at this temperature when a fix comes back unchanged
+STUCK_FIX_TEMPERATURE = 0.9
+
+
+class UnrenderableCodeError(ValueError):
+    """Generated code failed validation and was not handed to manim"""
+
+
+# Failures caused by the code itself (manim errors, validation rejects, a
+# scene that produced no video): only these go to the fixer, and a fix
+# identical to the failing code is bound to fail the same way again
+CODE_ERRORS = (subprocess.CalledProcessError, UnrenderableCodeError, FileNotFoundError)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    True if the error (or any error it was raised from) is a rate limit,
+    connection failure or 5xx response, i.e. worth retrying after a delay.
+    """
+    while error is not None:
+        if isinstance(error, TRANSIENT_LLM_ERRORS) or isinstance(error, httpx.TransportError):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            return status == 429 or status >= 500
+        error = error.__cause__ or error.__context__
+    return False
+
+
+
+def code_fingerprint(code: str) -> bytes:
+    """Digest of the code's AST (so formatting and comments don't count), or of the raw text if it doesn't parse"""
+    try:
+        normalized = ast.dump(ast.parse(code))
+    except SyntaxError:
+        normalized = code
+    return hashlib.sha256(normalized.encode()).digest()
+
+
+async def fix_code(
+    manim_code: str, error_details: str, attempt: int, supabase: Client
+) -> Tuple[str, str]:
+    """
+    Ask the LLM to fix code that failed to render. With SPECULATIVE_FIX, fixes
+    at several temperatures are requested concurrently and the first one that
+    validates best (lowest temperature on ties) is returned. A fix identical
+    to the input is retried once at a high temperature.
+    """
+    if not SPECULATIVE_FIX:
+        fixed = await fix_manim_code_with_error(manim_code, error_details, attempt, supabase)
+    else:
+        candidates = await asyncio.gather(*(
+            fix_manim_code_with_error(manim_code, error_details, attempt, supabase, temperature=temperature)
+            for temperature in SPECULATIVE_FIX_TEMPERATURES
+        ))
+        rank = {"ok": 0, "warn": 1, "fatal": 2}
+        fixed = min(candidates, key=lambda candidate: rank[validate_manim_code(candidate[0])[1]])
+    if code_fingerprint(fixed[0]) == code_fingerprint(manim_code):
+        logger.info("Fix returned unchanged code, retrying at a higher temperature")
+        fixed = await fix_manim_code_with_error(
+            manim_code, error_details, attempt, supabase, temperature=STUCK_FIX_TEMPERATURE
+        )
+    return fixed
+
+
+class TaskStatusWriter:
+    """
+    Buffers a task's in-progress status in memory and writes it to the videos
+    table at most once every `interval` seconds. Terminal states are written
+    immediately via finish(), together with anything still buffered.
+    """
+
+    def __init__(self, supabase: Client, task_id: str, interval: float = STATUS_FLUSH_INTERVAL):
+        self.supabase = supabase
+        self.task_id = task_id
+        self.interval = interval
+        self._pending: dict = {}
+        self._stop = asyncio.Event()
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def update(self, **fields) -> None:
+        """Record status fields; they are written on the next heartbeat"""
+        self._pending.update(fields)
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        fields, self._pending = self._pending, {}
+        await asyncio.to_thread(
+            self.supabase.table("videos").update(fields).eq("task_id", self.task_id).execute
+        )
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                try:
+                    await self._flush()
+                except Exception as e:
+                    logger.error("Status update failed for task %s: %s", self.task_id, e)
+
+    def start(self) -> None:
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._run())
+
+    async def finish(self, **fields) -> None:
+        """Stop the heartbeat and write the final status; errors propagate"""
+        self._stop.set()
+        if self._heartbeat is not None:
+            # Let an in-flight heartbeat write land before the final one
+            await self._heartbeat
+            self._heartbeat = None
+        self.update(**fields)
+        await self._flush()
+
+    async def annotate(self, **fields) -> None:
+        """
+        Best-effort write of optional columns once the task is finished. A
+        failure (e.g. the column has not been migrated yet) is logged, never
+        raised, so it cannot undo a completed task.
+        """
+        try:
+            await asyncio.to_thread(
+                self.supabase.table("videos").update(fields).eq("task_id", self.task_id).execute
+            )
+        except Exception as e:
+            logger.warning("Could not record %s for task %s: %s", ", ".join(fields), self.task_id, e)
 
 
-def render_and_upload_video(prompt: str, supabase: Client, task_id: str, max_retries: int = 5):
+async def render_and_upload_video(prompt: str, supabase: Client, task_id: str, max_retries: int = 5):
     """
     Renders a Manim video with a robust retry and self-correction loop.
     A successful render immediately uploads the video, updates the database, and exits.
     """
     last_error = None
+    # Last deterministic failure of the current code, i.e. what a fix has to address
+    fix_error = None
     manim_code = None
+    explanation = ""
+    # Where the code came from: "semantic", "template", "program" or "llm"
+    code_source = None
+    program_cluster = None
+    template_id = None
+    completed = False
+    # Rendered video and its public URL, kept across attempts once they exist
+    video_path = None
+    public_url = None
+    code_hash = None
+    started = time.monotonic()
     
-    # Initial status update
-    try:
-        supabase.table("videos").update({
-            "status": "processing",
-        }).eq("task_id", task_id).execute()
-    except Exception as db_error:
-        logger.error(f"Initial DB update failed for task {task_id}: {db_error}")
-        # Depending on requirements, you might want to stop here
-        # raise db_error 
-
-    for attempt in range(1, max_retries + 1):
-        logger.info(f"Attempt {attempt}/{max_retries} for task {task_id}")
+    # In-progress status is buffered and flushed periodically; only terminal
+    # states cost an immediate round trip
+    task_status = TaskStatusWriter(supabase, task_id)
+    task_status.update(status="processing")
+    task_status.start()
+
+    # One working directory for every attempt, so manim can reuse partial
+    # movie files of unchanged animations (and videos live until uploaded)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for attempt in range(1, max_retries + 1):
+            logger.info("Attempt %d/%d for task %s", attempt, max_retries, task_id)
         
-        try:
-            # Step 1: Generate or fix Manim code
-            if attempt == 1:
-                logger.info("Generating initial Manim code...")
-                manim_code, explanation = enhance_prompt_and_generate_code(prompt)
-                logger.info(f"Code generation explanation: {explanation}")
-            else:
-                logger.info(f"Fixing code based on error from attempt {attempt - 1}...")
-                # Format the last known error for the LLM
-                error_details = format_error_for_llm(last_error, manim_code) # type: ignore
-                manim_code, fix_explanation = fix_manim_code_with_error(
-                    manim_code or "", 
-                    error_details, 
-                    attempt
-                )
-                logger.info(f"Fix explanation: {fix_explanation}")
-            
-            # Optional: Validate code structure before rendering
-            is_valid, validation_msg = validate_manim_code(manim_code)
-            if not is_valid:
-                logger.warning(f"Generated code validation failed: {validation_msg}")
-            
-            logger.info("Attempting to render the video...")
-            
-            # Step 2: Render the video
-            video_path = render_manim_video(manim_code, task_id)
+            try:
+                # A video that rendered (or uploaded) on an earlier attempt is
+                # kept; only the step that failed is retried
+                if video_path is None and public_url is None:
+                    # Step 1: Generate (or regenerate after a transient failure) or fix Manim code
+                    if manim_code is None:
+                        cached = await asyncio.to_thread(semantic_cache.lookup, prompt)
+                        template = None if cached else await template_library.lookup(prompt)
+                        program = None if cached or template else await program_cache.lookup(prompt)
+                        if cached:
+                            logger.info("Using cached Manim code for a matching prompt")
+                            manim_code, explanation = cached
+                            code_source = "semantic"
+                        elif template:
+                            template_id, manim_code = template
+                            code_source = "template"
+                            logger.info("Using curated template %s for this prompt", template_id)
+                            explanation = f"Animation rendered from the curated template {template_id}"
+                        elif program:
+                            logger.info("Using cached program template for this prompt")
+                            program_cluster, manim_code = program
+                            explanation = "Animation rendered from a cached program template"
+                            code_source = "program"
+                        else:
+                            logger.info("Generating initial Manim code...")
+                            manim_code, explanation = await enhance_prompt_and_generate_code(prompt, supabase)
+                            code_source = "llm"
+                            logger.info("Code generation explanation: %s", explanation)
+                    elif fix_error is None:
+                        # Something other than the code (API, disk, ...) stopped it
+                        logger.info("Retrying the same code after an error unrelated to it")
+                    else:
+                        logger.info("Fixing code based on error from attempt %d...", attempt - 1)
+                        # Format the last known error for the LLM
+                        error_details = format_error_for_llm(fix_error, manim_code)
+                        previous_fingerprint = code_fingerprint(manim_code)
+                        manim_code, fix_explanation = await fix_code(
+                            manim_code or "", 
+                            error_details, 
+                            attempt,
+                            supabase
+                        )
+                        logger.info("Fix explanation: %s", fix_explanation)
+                        fix_error = None
+                        # fix_error is always a CODE_ERRORS failure, so rendering
+                        # the same code again can only fail the same way
+                        if code_fingerprint(manim_code) == previous_fingerprint:
+                            logger.error("No new fix for task %s, giving up", task_id)
+                            break
             
-            # 💡 SUCCESS! If we get here, rendering worked.
-            # The success logic is now INSIDE the loop's try block.
-            logger.info("Manim rendering successful!")
+                    # Validate code structure before rendering; code that cannot
+                    # render goes straight to the fix path without starting manim
+                    is_valid, severity, validation_msg = validate_manim_code(manim_code)
+                    if severity == "fatal":
+                        raise UnrenderableCodeError(f"Generated code is not renderable: {validation_msg}")
+                    if not is_valid:
+                        logger.warning("Generated code validation failed: %s", validation_msg)
+                    # Skip even the slice when debug output is off
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Manim code to render:\n%s...", manim_code[:500])
             
-            # Step 3: Upload the successful video
-            public_url = upload_video_to_supabase(video_path, task_id, supabase)
+                    logger.info("Attempting to render the video...")
             
-            # Step 4: Update database with 'completed' status
-            supabase.table("videos").update({
-                "video_url": public_url,
-                "status": "completed",
-                "attempts": attempt,
-                "final_code": manim_code,
-                "error_message": None # Clear any previous error messages
-            }).eq("task_id", task_id).execute()
+                    # Step 2: Render the video, unless identical code was already rendered
+                    code_hash = hashlib.sha256(manim_code.encode()).hexdigest()
+                    public_url = await find_rendered_video(code_hash, supabase)
+                    if public_url:
+                        logger.info("Identical code already rendered, reusing video: %s", public_url)
+                    else:
+                        scene_name = extract_scene_name_from_code(manim_code)
+                        video_path = await render_manim_video(
+                            manim_code, task_id, tmpdir, scene_name, output_name=f"{task_id}_{attempt}"
+                        )
+                        logger.info("Manim rendering successful!")
+
+                # Step 3: Upload the successful video straight from the render directory
+                if public_url is None:
+                    public_url = await asyncio.to_thread(upload_video_to_supabase, video_path, task_id, supabase)
             
-            logger.info(f"Task {task_id} completed and video uploaded: {public_url}")
+                # Step 4: Update database with 'completed' status
+                await task_status.finish(
+                    video_url=public_url,
+                    status="completed",
+                    attempts=attempt,
+                    final_code=manim_code,
+                    error_message=None # Clear any previous error messages
+                )
+                # Lets later tasks reuse this video (see find_rendered_video)
+                await task_status.annotate(code_hash=code_hash)
+                if template_id is not None:
+                    await task_status.annotate(template_id=template_id)
             
-            # Step 5: Return the URL and exit the function entirely
-            return public_url
+                logger.info("Task %s completed and video uploaded: %s", task_id, public_url)
+                completed = True
+                break
             
-        except subprocess.CalledProcessError as e:
-            last_error = e
+            except subprocess.CalledProcessError as e:
+                # Deterministic failure: retry right away, the LLM needs the error
+                last_error = fix_error = e
+                transient = False
+                video_path = None
+                if program_cluster is not None:
+                    await program_cache.discard(program_cluster)
+                    program_cluster = None
             
-            # Check if stderr is bytes before decoding, otherwise use it directly.
-            if e.stderr:
-                stderr_output = e.stderr.decode(errors='ignore') if isinstance(e.stderr, bytes) else e.stderr
-            else:
-                stderr_output = "No stderr output."
-                
-            error_msg = f"Manim subprocess error: {stderr_output}"
-            logger.error(f"Attempt {attempt} failed with subprocess error: {error_msg}")
-        except Exception as e:
-            last_error = e
-            error_msg = f"An unexpected error occurred: {str(e)}"
-            logger.error(f"Attempt {attempt} failed with error: {error_msg}")
-
-        # If the loop continues, update the status with the latest error
-        supabase.table("videos").update({
-            "status": "processing",
-            "attempts": attempt,
-            "error_message": error_msg
-        }).eq("task_id", task_id).execute()
+                stderr_output = e.stderr or "No stderr output."
+                error_msg = f"Manim subprocess error: {stderr_output}"
+                logger.error("Attempt %d failed with subprocess error: %s", attempt, error_msg)
+            except Exception as e:
+                last_error = e
+                transient = is_transient_error(e)
+                # Only a failure of the code itself goes to the fixer; upload
+                # and database errors retry that step with the same video
+                if isinstance(e, CODE_ERRORS):
+                    fix_error = e
+                    video_path = None
+                    if program_cluster is not None:
+                        await program_cache.discard(program_cluster)
+                        program_cluster = None
+                error_msg = f"An unexpected error occurred: {str(e)}"
+                logger.error("Attempt %d failed with error: %s", attempt, error_msg)
+
+            # If the loop continues, record the latest error for the next flush
+            task_status.update(status="processing", attempts=attempt, error_message=error_msg)
+
+            # Back off before retrying a transient failure (capped exponential with jitter)
+            if transient and attempt < max_retries:
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                if time.monotonic() - started + delay > MAX_RETRY_TIME:
+                    logger.error("Retry time budget exhausted for task %s, giving up", task_id)
+                    break
+                logger.info("Transient error, retrying in %.1fs", delay)
+                await asyncio.sleep(delay)
+
+    if completed:
+        # The task is complete; remember code that is known to render for
+        # similar prompts (the caches log and swallow their own errors)
+        await confirm_rendered_code(supabase, manim_code)
+        await asyncio.to_thread(semantic_cache.store, prompt, manim_code, explanation)
+        # Only freshly generated code; cached code is already a member (or a
+        # template) and would fill clusters with copies of itself
+        if code_source == "llm":
+            await program_cache.record(prompt, manim_code)
+        return public_url
 
     # If the loop completes without a successful return, it means all retries have failed.
-    final_error_message = f"Failed to render video for task {task_id} after {max_retries} attempts."
+    final_error_message = f"Failed to render video for task {task_id} after {attempt} of {max_retries} attempts."
     logger.error(final_error_message)
     
     # Final update to the database to mark as 'failed'
-    supabase.table("videos").update({
-        "status": "failed",
-        "error_message": str(last_error), # Store the last captured error
-        "video_url": None
-    }).eq("task_id", task_id).execute()
+    await task_status.finish(
+        status="failed",
+        error_message=str(last_error), # Store the last captured error
+        video_url=None
+    )
     
     # Raise an exception to signify failure to the caller
     raise Exception(final_error_message)
 
 
+async def find_rendered_video(code_hash: str, supabase: Client) -> Optional[str]:
+    """
+    Return the URL of a completed video rendered from identical code, if any.
+    Lookup failures are logged and treated as a miss.
+    """
+    try:
+        result = await asyncio.to_thread(
+            supabase.table("videos")
+            .select("video_url")
+            .eq("code_hash", code_hash)
+            .eq("status", "completed")
+            .limit(1)
+            .execute
+        )
+    except Exception as e:
+        logger.warning("Rendered video lookup failed: %s", e)
+        return None
+    return result.data[0]["video_url"] if result.data else None
+
+
 def format_error_for_llm(error: Exception, code: str) -> str:
     """
     Format error information in a structured way for the LLM to understand
     """
     if isinstance(error, subprocess.CalledProcessError):
         # Get stderr if available
-        stderr_output = error.stderr.decode() if error.stderr else "No stderr available"
-        stdout_output = error.stdout.decode() if error.stdout else "No stdout available"
+        stderr_output = error.stderr or "No stderr available"
+        stdout_output = error.stdout or "No stdout available"
         
         return f"""MANIM SUBPROCESS ERROR:
 Return Code: {error.returncode}
-Command: {' '.join(error.cmd)}
+Command: {shlex.join(error.cmd)}
 
 STDERR OUTPUT:
 {stderr_output}
@@ -259,147 +438,147 @@ Error Type: {type(error).__name__}
 Error Message: {str(error)}
 
 Traceback:
-{traceback.format_exc()}
+{''.join(traceback.format_exception(type(error), error, error.__traceback__))}
 
 This error occurred during code execution or preparation.
 """
 
 
-def render_manim_video(manim_code: str, task_id: str) -> str:
+async def read_tail(stream: asyncio.StreamReader, max_bytes: int = OUTPUT_TAIL_BYTES) -> str:
     """
-    Render Manim video and return the path to the generated video file
+    Read a subprocess pipe in fixed-size chunks and return its last `max_bytes`
+    bytes. Memory stays bounded however much manim logs, and unlike readline
+    this can't fail on very long lines (e.g. progress bars redrawn with \\r).
     """
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # Write the code to a file
-        file_name = f"{task_id}.py"
-        file_path = os.path.join(tmpdir, file_name)
-        
-        with open(file_path, "w", encoding='utf-8') as f:
-            f.write(manim_code)
-        
-        # Extract scene name from code
-        scene_name = extract_scene_name_from_code(manim_code)
-        logger.info(f"Using scene name: {scene_name}")
-        
-        # Set up output directory
-        output_dir = os.path.join(tmpdir, "media")
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Run Manim command
-        cmd = [
-            "manim",
-            "-pql",  # Preview, Quality Low (for faster rendering)
-            "--output_file", f"{task_id}",  # Custom output filename
-            file_path,
-            scene_name
-        ]
-        
-        logger.info(f"Running command: {' '.join(cmd)}")
-        
-        # Execute with proper error capture
-        result = subprocess.run(
-            cmd, 
-            check=True, 
-            capture_output=True,
-            text=True,
-            cwd=tmpdir
-        )
-        
-        logger.info(f"Manim stdout: {result.stdout}")
-        if result.stderr:
-            logger.warning(f"Manim stderr: {result.stderr}")
-        
-        # Find the generated video file
-        # Manim typically saves to media/videos/{filename}/{quality}/{scene_name}.mp4
-        possible_paths = [
-            os.path.join(tmpdir, "media", "videos", task_id, "480p15", f"{scene_name}.mp4"),
-            os.path.join(tmpdir, "media", "videos", task_id, "480p15", f"{task_id}.mp4"),
-            os.path.join(tmpdir, f"{task_id}.mp4"),
-            os.path.join(tmpdir, f"{scene_name}.mp4"),
-        ]
-        
-        video_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                video_path = path
-                logger.info(f"Found video at: {path}")
-                break
-        
-        if not video_path:
-            # List all files in the directory for debugging
-            logger.error("Video file not found. Directory contents:")
-            for root, dirs, files in os.walk(tmpdir):
-                for file in files:
-                    logger.error(f"  {os.path.join(root, file)}")
-            raise FileNotFoundError(f"Rendered video not found. Expected at one of: {possible_paths}")
-        
-        # Copy video to a temporary location that won't be deleted
-        import shutil
-        temp_video_path = f"/tmp/{task_id}.mp4"
-        shutil.copy2(video_path, temp_video_path)
-        return temp_video_path
-
-
-# def upload_video_to_supabase(video_path: str, task_id: str, supabase: Client) -> str:
+    tail = bytearray()
+    while chunk := await stream.read(STREAM_CHUNK_SIZE):
+        tail += chunk
+        # Trim in batches rather than on every chunk
+        if len(tail) > 2 * max_bytes:
+            del tail[:-max_bytes]
+    return bytes(tail[-max_bytes:]).decode("utf-8", "ignore")
+
+
+async def render_manim_video(
+    manim_code: str,
+    task_id: str,
+    tmpdir: str,
+    scene_name: Optional[str] = None,
+    output_name: Optional[str] = None
+) -> str:
     """
-    Upload video file to Supabase storage and return public URL.
+    Render Manim video in `tmpdir` and return the path to the generated video file.
+    Reusing the same `tmpdir` across attempts lets manim reuse the partial movie
+    files of animations that did not change. The file lives as long as `tmpdir`.
     """
-    try:
-        with open(video_path, "rb") as file:
-            file_data = file.read()
-
-        # Upload to Supabase storage (no FileOptions needed)
-        result = supabase.storage.from_("videosbucket").upload(
-            path=f"{task_id}.mp4",
-            file=file_data,
-            file_options={"cache-control": "3600", "upsert": "false"}
+    # Write the code to a file (same name every attempt, so manim's per-scene
+    # cache directory stays the same)
+    file_name = f"{task_id}.py"
+    file_path = os.path.join(tmpdir, file_name)
+    
+    with open(file_path, "w", encoding='utf-8') as f:
+        f.write(manim_code)
+    
+    # Extract scene name from code unless the caller already did
+    if scene_name is None:
+        scene_name = extract_scene_name_from_code(manim_code)
+    logger.info("Using scene name: %s", scene_name)
+    
+    # Callers pass a unique output name per attempt so attempts sharing
+    # `tmpdir` never overwrite each other's video
+    output_name = output_name or task_id
+    
+    # Set up output directory
+    output_dir = os.path.join(tmpdir, "media")
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Run Manim command
+    cmd = [
+        "manim",
+        "-ql",  # Quality Low (for faster rendering); no -p, there is no video player here
+        "--write_to_movie",
+        "--output_file", output_name,  # Custom output filename
+        "--media_dir", output_dir,  # Stable across attempts, keeps manim's cache
+        file_path,
+        scene_name
+    ]
+    
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Running command: %s", shlex.join(cmd))
+    
+    # Execute without blocking the event loop, with proper error capture
+    async with RENDER_SEMAPHORE:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=tmpdir,
+            # One thread per render so parallel renders don't oversubscribe cores,
+            # and keep matplotlib/TeX helpers from looking for a display
+            env={**os.environ, "OMP_NUM_THREADS": "1", "DISPLAY": "", "MPLBACKEND": "Agg"},
         )
-
-        if not result:
-            logger.error(f"Upload error: {result.error.message}")
-            raise Exception(f"Upload failed: {result.error.message}")
-
-        logger.info(f"Upload successful for task: {task_id}")
-
-        # Get public URL
-        public_url_response = supabase.storage.from_("videosbucket").get_public_url(f"{task_id}.mp4")
-        public_url = getattr(public_url_response, "public_url", None)
-
-        if not public_url:
-            raise Exception("Failed to retrieve public URL after upload.")
-
-        # Clean up temporary file
         try:
-            os.remove(video_path)
-        except Exception as cleanup_error:
-            logger.warning(f"Could not remove temporary file: {cleanup_error}")
-
-        return public_url
-
-    except Exception as e:
-        logger.error(f"Error uploading to Supabase: {str(e)}")
-        raise Exception(f"Failed to upload video to storage: {str(e)}")
+            # Stream both pipes concurrently, keeping only the tail of each
+            stdout, stderr = await asyncio.gather(read_tail(proc.stdout), read_tail(proc.stderr))
+            returncode = await proc.wait()
+        except BaseException:
+            # A failed reader or a cancelled task must not leave manim
+            # running with nobody reading its pipes
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+            raise
+    
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stdout, stderr)
+    
+    logger.info("Manim stdout: %s", stdout)
+    if stderr:
+        logger.warning("Manim stderr: %s", stderr)
+    
+    # Find the generated video file
+    # Manim saves to media/videos/{filename}/{quality}/{output_name}.mp4
+    quality_dir = os.path.join(output_dir, "videos", task_id, "480p15")
+    video_path = os.path.join(quality_dir, f"{output_name}.mp4")
+    
+    if not os.path.exists(video_path):
+        # Other quality folders: take the newest match, skipping partial movie files
+        candidates = sorted(
+            (
+                path for pattern in (f"{output_name}.mp4", f"{scene_name}.mp4")
+                for path in Path(tmpdir).rglob(pattern)
+                if "partial_movie_files" not in path.parts
+            ),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True,
+        )
+        if not candidates:
+            # Only list the two directories the video is expected in
+            logger.error("Video file not found. Directory contents:")
+            for directory in (quality_dir, tmpdir):
+                if os.path.isdir(directory):
+                    logger.error("  %s: %s", directory, os.listdir(directory))
+            raise FileNotFoundError(f"Rendered video not found. Expected at: {video_path}")
+        video_path = str(candidates[0])
+    
+    logger.info("Found video at: %s", video_path)
+    return video_path
 
 
 def upload_video_to_supabase(video_path: str, task_id: str, supabase: Client) -> str:
     """
     Uploads a video file to Supabase storage and correctly returns the public URL.
+    The file is streamed in fixed-size chunks over Supabase's resumable (TUS)
+    endpoint, so memory use does not grow with the size of the video.
     """
     try:
         # The bucket name should likely be a constant or config variable
         bucket_name = "videosbucket"
         file_path_in_bucket = f"{task_id}.mp4"
 
-        with open(video_path, "rb") as file:
-            # Note: For large files, consider a streaming upload if the library supports it.
-            supabase.storage.from_(bucket_name).upload(
-                path=file_path_in_bucket,
-                file=file,
-                # Using file object directly is often more memory-efficient
-                file_options={"cache-control": "3600", "upsert": "true"} # 'upsert' is often better than 'false'
-            )
+        upload_resumable(supabase, bucket_name, file_path_in_bucket, video_path)
 
-        logger.info(f"Upload successful for task: {task_id}")
+        logger.info("Upload successful for task: %s", task_id)
 
         # --- THIS IS THE FIX ---
         # The get_public_url method returns the string directly.
@@ -412,19 +591,70 @@ def upload_video_to_supabase(video_path: str, task_id: str, supabase: Client) ->
         return public_url
 
     except Exception as e:
-        logger.error(f"Error during Supabase operation for task {task_id}: {str(e)}")
+        logger.error("Error during Supabase operation for task %s: %s", task_id, e)
         # Re-raise a more specific error to be handled by the main loop
         raise Exception(f"Failed during Supabase storage operation: {str(e)}")
-    finally:
-        # Cleanup should happen regardless of success or failure
-        try:
-            if os.path.exists(video_path):
-                os.remove(video_path)
-                logger.info(f"Cleaned up temporary file: {video_path}")
-        except Exception as cleanup_error:
-            logger.warning(f"Could not remove temporary file {video_path}: {cleanup_error}")
 
 
+def upload_resumable(supabase: Client, bucket_name: str, object_name: str, file_path: str) -> None:
+    """
+    Upload a file with the TUS protocol: create the upload, then PATCH it one
+    chunk at a time. A chunk that fails on a network error is resumed from the
+    offset the server reports instead of restarting the whole upload.
+    """
+    headers = {
+        "Authorization": f"Bearer {supabase.supabase_key}",
+        "apikey": supabase.supabase_key,
+        "Tus-Resumable": "1.0.0",
+    }
+    metadata = {
+        "bucketName": bucket_name,
+        "objectName": object_name,
+        "contentType": "video/mp4",
+        "cacheControl": "3600",
+    }
+    size = os.path.getsize(file_path)
+
+    response = UPLOAD_CLIENT.post(
+        f"{str(supabase.supabase_url).rstrip('/')}/storage/v1/upload/resumable",
+        headers={
+            **headers,
+            "Upload-Length": str(size),
+            "Upload-Metadata": ",".join(
+                f"{key} {base64.b64encode(value.encode()).decode()}" for key, value in metadata.items()
+            ),
+            "x-upsert": "true",
+        },
+    )
+    response.raise_for_status()
+    upload_url = response.headers["Location"]
+
+    offset, failures = 0, 0
+    with open(file_path, "rb") as file:
+        while offset < size:
+            file.seek(offset)
+            chunk = file.read(UPLOAD_CHUNK_SIZE)
+            try:
+                response = UPLOAD_CLIENT.patch(
+                    upload_url,
+                    content=chunk,
+                    headers={
+                        **headers,
+                        "Upload-Offset": str(offset),
+                        "Content-Type": "application/offset+octet-stream",
+                    },
+                )
+                response.raise_for_status()
+                offset = int(response.headers["Upload-Offset"])
+            except httpx.TransportError:
+                failures += 1
+                if failures > UPLOAD_CHUNK_RETRIES:
+                    raise
+                # Ask the server how much of the file it already has
+                response = UPLOAD_CLIENT.head(upload_url, headers=headers)
+                response.raise_for_status()
+                offset = int(response.headers["Upload-Offset"])
+
 
 def get_video_info(task_id: str, supabase: Client) -> dict:
     """
@@ -456,7 +686,7 @@ def get_video_info(task_id: str, supabase: Client) -> dict:
             }
 
     except Exception as e:
-        logger.error(f"Error fetching video info for task {task_id}: {str(e)}")
+        logger.error("Error fetching video info for task %s: %s", task_id, e)
         return {
             "status": "error",
             "error_message": f"Failed to get video info: {str(e)}",
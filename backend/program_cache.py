@@ -0,0 +1,269 @@
+"""
+Program cache for generated Manim scenes (GenCache-style).
+
+Prompts that rendered successfully are clustered by embedding similarity.
+Once a cluster has enough members, the LLM generalizes their code into one
+program whose varying values live in a single-line PARAMS dict. Later
+prompts that fall into the cluster reuse that program with their own
+parameters, skipping the code generation call entirely.
+
+Clusters are stored in SQLite so they survive restarts. Like the semantic
+cache, this needs sentence-transformers for embeddings and is a no-op
+without it.
+"""
+import ast
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+import numpy as np
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from llm_cache import embed
+from llm_utils import extract_program_params, generate_program_template
+
+logger = logging.getLogger(__name__)
+
+PROGRAM_CACHE_PATH = os.environ.get(
+    "PROGRAM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "program_cache.db"),
+)
+CLUSTER_THRESHOLD = 0.85
+MIN_CLUSTER_SIZE = 4
+
+_PARAMS_LINE_RE = re.compile(r'^PARAMS\s*=\s*(\{.*\})\s*$', re.MULTILINE)
+
+
+def parse_params(template: str) -> Optional[Dict[str, Any]]:
+    """Return the default PARAMS dict of a template, or None if it has no usable one"""
+    match = _PARAMS_LINE_RE.search(template)
+    if not match:
+        return None
+    try:
+        params = ast.literal_eval(match.group(1))
+    except (ValueError, SyntaxError):
+        return None
+    return params if isinstance(params, dict) and params else None
+
+
+def _apply_params(template: str, params: Dict[str, Any]) -> str:
+    """Replace the template's PARAMS line with the given values"""
+    line = f"PARAMS = {params!r}"
+    return _PARAMS_LINE_RE.sub(lambda _: line, template, count=1)
+
+
+def _conforms(value: Any, default: Any) -> bool:
+    """True if `value` has the same shape of type as the template default"""
+    if isinstance(default, bool):
+        return isinstance(value, bool)
+    if isinstance(default, (int, float)):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if isinstance(default, str):
+        return isinstance(value, str)
+    if isinstance(default, list):
+        return isinstance(value, list) and (not default or all(_conforms(item, default[0]) for item in value))
+    if isinstance(default, dict):
+        return isinstance(value, dict)
+    return True
+
+
+async def fill_template(
+    template: str,
+    param_schema: Dict[str, Any],
+    prompt: str,
+    check: Optional[Callable[[Dict[str, Any]], bool]] = None,
+) -> Optional[str]:
+    """
+    Return the template with its PARAMS set from values extracted from the
+    prompt, or None if they could not be extracted, do not match the types of
+    the template defaults, or fail `check`.
+    """
+    params = await extract_program_params(prompt, param_schema)
+    if params is None:
+        return None
+    # Unknown keys are dropped; missing ones keep the template defaults
+    values = {name: params.get(name, default) for name, default in param_schema.items()}
+    if not all(_conforms(values[name], default) for name, default in param_schema.items()):
+        logger.info("Extracted parameters do not match the template: %s", values)
+        return None
+    if check is not None and not check(values):
+        logger.info("Extracted parameters rejected by the template: %s", values)
+        return None
+    return _apply_params(template, values)
+
+
+class ProgramCache:
+    """SQLite-backed store of prompt clusters and their parameterized programs"""
+
+    def __init__(
+        self,
+        path: str = PROGRAM_CACHE_PATH,
+        threshold: float = CLUSTER_THRESHOLD,
+        min_cluster_size: int = MIN_CLUSTER_SIZE,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.min_cluster_size = min_cluster_size
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @contextmanager
+    def _db(self) -> Iterator[sqlite3.Connection]:
+        """Serialized connection that commits on success and is always closed"""
+        with self._lock:
+            conn = sqlite3.connect(self.path)
+            try:
+                with conn:
+                    self._init_schema(conn)
+                    yield conn
+            finally:
+                conn.close()
+
+    def _init_schema(self, conn: sqlite3.Connection) -> None:
+        if not self._initialized:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS clusters (
+                    id INTEGER PRIMARY KEY,
+                    centroid BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    template TEXT,
+                    param_schema TEXT
+                );
+                CREATE TABLE IF NOT EXISTS members (
+                    cluster_id INTEGER NOT NULL REFERENCES clusters(id),
+                    prompt TEXT NOT NULL,
+                    code TEXT NOT NULL
+                );
+            """)
+            self._initialized = True
+
+    def _nearest_cluster(self, conn: sqlite3.Connection, embedding: np.ndarray) -> Optional[Tuple[int, float]]:
+        rows = conn.execute("SELECT id, centroid FROM clusters").fetchall()
+        if not rows:
+            return None
+        centroids = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+        similarities = centroids @ embedding
+        best = int(np.argmax(similarities))
+        return rows[best][0], float(similarities[best])
+
+    def _find_template(self, prompt: str) -> Optional[Tuple[int, str, Dict[str, Any]]]:
+        embedding = embed(prompt)
+        if embedding is None:
+            return None
+        embedding = embedding.astype(np.float32)
+        with self._db() as conn:
+            nearest = self._nearest_cluster(conn, embedding)
+            if nearest is None or nearest[1] < self.threshold:
+                return None
+            row = conn.execute(
+                "SELECT template, param_schema FROM clusters WHERE id = ?", (nearest[0],)
+            ).fetchone()
+        if not row or not row[0]:
+            return None
+        return nearest[0], row[0], json.loads(row[1])
+
+    def _add_member(self, prompt: str, code: str) -> Optional[Tuple[int, List[Tuple[str, str]]]]:
+        """
+        Add a prompt to its cluster (creating one if needed).
+        Returns (cluster_id, examples) when the cluster is ready for a template.
+        """
+        embedding = embed(prompt)
+        if embedding is None:
+            return None
+        embedding = embedding.astype(np.float32)
+        with self._db() as conn:
+            nearest = self._nearest_cluster(conn, embedding)
+            if nearest is None or nearest[1] < self.threshold:
+                cursor = conn.execute(
+                    "INSERT INTO clusters (centroid, size) VALUES (?, 1)", (embedding.tobytes(),)
+                )
+                cluster_id, size, template = cursor.lastrowid, 1, None
+            else:
+                cluster_id = nearest[0]
+                blob, size, template = conn.execute(
+                    "SELECT centroid, size, template FROM clusters WHERE id = ?", (cluster_id,)
+                ).fetchone()
+                # Running mean of the member embeddings, kept unit-norm
+                centroid = np.frombuffer(blob, dtype=np.float32) * size + embedding
+                centroid /= np.linalg.norm(centroid)
+                size += 1
+                conn.execute(
+                    "UPDATE clusters SET centroid = ?, size = ? WHERE id = ?",
+                    (centroid.astype(np.float32).tobytes(), size, cluster_id),
+                )
+            conn.execute(
+                "INSERT INTO members (cluster_id, prompt, code) VALUES (?, ?, ?)",
+                (cluster_id, prompt, code),
+            )
+            if template is not None or size < self.min_cluster_size:
+                return None
+            examples = conn.execute(
+                "SELECT prompt, code FROM members WHERE cluster_id = ? ORDER BY rowid DESC LIMIT ?",
+                (cluster_id, self.min_cluster_size),
+            ).fetchall()
+        return cluster_id, examples
+
+    def _clear_template(self, cluster_id: int) -> None:
+        with self._db() as conn:
+            conn.execute(
+                "UPDATE clusters SET template = NULL, param_schema = NULL WHERE id = ?", (cluster_id,)
+            )
+
+    def _save_template(self, cluster_id: int, template: str, param_schema: Dict[str, Any]) -> None:
+        with self._db() as conn:
+            conn.execute(
+                "UPDATE clusters SET template = ?, param_schema = ? WHERE id = ?",
+                (template, json.dumps(param_schema), cluster_id),
+            )
+
+    async def lookup(self, prompt: str) -> Optional[Tuple[int, str]]:
+        """Return (cluster_id, ready-to-render code) for the prompt from a cached program, if any"""
+        try:
+            found = await asyncio.to_thread(self._find_template, prompt)
+            if found is None:
+                return None
+            cluster_id, template, param_schema = found
+            code = await fill_template(template, param_schema, prompt)
+            if code is None:
+                return None
+            logger.info("Returning cached response.")
+            return cluster_id, code
+        except Exception as e:
+            logger.warning("Program cache lookup failed: %s", e)
+            return None
+
+    async def discard(self, cluster_id: int) -> None:
+        """
+        Drop a cluster's program after code built from it failed to render.
+        Templates are saved without being rendered, so this is what keeps a bad
+        one from seeding every later prompt in the cluster; the next recorded
+        member builds a new one.
+        """
+        try:
+            await asyncio.to_thread(self._clear_template, cluster_id)
+            logger.info("Discarded program template for cluster %d", cluster_id)
+        except Exception as e:
+            logger.warning("Program cache update failed: %s", e)
+
+    async def record(self, prompt: str, code: str) -> None:
+        """Record successfully rendered code, building the cluster's program once it is large enough"""
+        try:
+            ready = await asyncio.to_thread(self._add_member, prompt, code)
+            if ready is None:
+                return
+            cluster_id, examples = ready
+            template = await generate_program_template(examples)
+            param_schema = parse_params(template) if template else None
+            if param_schema is None:
+                logger.info("No usable program template for cluster %d", cluster_id)
+                return
+            await asyncio.to_thread(self._save_template, cluster_id, template, param_schema)
+            logger.info("Stored program template for cluster %d", cluster_id)
+        except Exception as e:
+            logger.warning("Program cache update failed: %s", e)
+
+
+program_cache = ProgramCache()
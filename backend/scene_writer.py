@@ -0,0 +1,114 @@
+"""
+Single-pass movie writer for Manim scenes.
+
+Manim's default SceneFileWriter encodes every animation into its own partial
+movie file and concatenates them when the scene finishes. The writer below
+keeps one ffmpeg process open for the whole scene and pipes raw frames
+straight into the final movie file instead.
+
+Audio is not supported: the movie is written without an audio stream, so
+sounds added with Scene.add_sound are dropped (with a warning).
+"""
+import logging
+import subprocess
+import numpy as np
+from manim import Camera, Scene, config
+from manim.renderer.cairo_renderer import CairoRenderer
+from manim.scene.scene_file_writer import SceneFileWriter
+
+logger = logging.getLogger(__name__)
+
+
+def _aligned_empty(shape, dtype=np.uint8, alignment: int = 32) -> np.ndarray:
+    """Allocate an uninitialised array whose data pointer is aligned to `alignment` bytes"""
+    n = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    buf = np.empty(n + alignment, dtype=np.uint8)
+    offset = (-buf.ctypes.data) % alignment
+    return buf[offset:offset + n].view(dtype).reshape(shape)
+
+
+class AlignedCamera(Camera):
+    """Camera whose pixel array (the buffer Cairo draws into) is 32-byte aligned"""
+
+    def init_background(self):
+        super().init_background()
+        # reset() copies the background into an existing array of the same
+        # shape in place, so this buffer is kept for the camera's lifetime
+        self.pixel_array = _aligned_empty(self.background.shape, self.background.dtype)
+        self.pixel_array[...] = self.background
+
+
+class PipedSceneFileWriter(SceneFileWriter):
+    """Stream every frame of a scene to a single persistent ffmpeg process"""
+
+    def __init__(self, *args, **kwargs):
+        self.proc = None
+        super().__init__(*args, **kwargs)
+
+    def begin_animation(self, allow_write: bool = False, file_path=None):
+        if allow_write and config["write_to_movie"] and self.proc is None:
+            self.open_pipe()
+
+    def end_animation(self, allow_write: bool = False):
+        # The pipe stays open until the scene finishes
+        pass
+
+    def open_pipe(self):
+        """Start ffmpeg reading raw RGBA frames from stdin"""
+        width, height = config["pixel_width"], config["pixel_height"]
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "rgba",
+            "-s", f"{width}x{height}",
+            "-r", str(config["frame_rate"]),
+            "-i", "-",
+            "-an",
+            "-vcodec", "libx264",
+            "-preset", "ultrafast",
+            "-pix_fmt", "yuv420p",
+            str(self.movie_file_path),
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write_frame(self, frame, num_frames: int = 1):
+        if self.proc is None:
+            return
+        # Write the frame buffer as-is instead of copying it with tobytes()
+        data = memoryview(np.ascontiguousarray(frame))
+        for _ in range(num_frames):
+            self.proc.stdin.write(data)
+
+    def combine_to_movie(self):
+        # Frames already went to the final file, so just close the pipe
+        if self.proc is None:
+            return
+        if self.includes_sound:
+            logger.warning("PipedSceneFileWriter does not support audio; the scene's sounds were dropped")
+        self.proc.stdin.close()
+        returncode = self.proc.wait()
+        self.proc = None
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, "ffmpeg")
+        self.print_file_ready_message(self.movie_file_path)
+
+
+class PipedScene(Scene):
+    """Scene rendered with the Cairo renderer through PipedSceneFileWriter (video only, no audio)"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("camera_class", AlignedCamera)
+        config["write_to_movie"] = True
+        config["save_last_frame"] = False
+        # Partial movie files are never written, so there is nothing to reuse;
+        # this also skips hashing every play() call
+        config["disable_caching"] = True
+        if kwargs.get("renderer") is None:
+            kwargs["renderer"] = CairoRenderer(
+                file_writer_class=PipedSceneFileWriter,
+                camera_class=kwargs["camera_class"],
+                skip_animations=kwargs.get("skip_animations", False),
+            )
+        super().__init__(**kwargs)
@@ -0,0 +1,7 @@
+-- Hash of the code a video was rendered from, so identical code reuses the
+-- finished video instead of rendering it again (manim_renderer.find_rendered_video)
+alter table videos add column if not exists code_hash text;
+
+create index if not exists videos_code_hash_completed_idx
+    on videos (code_hash)
+    where status = 'completed';
@@ -0,0 +1,2 @@
+-- Curated template (name@vN) a video was rendered from, if any (template_library)
+alter table videos add column if not exists template_id text;
@@ -0,0 +1,7 @@
+-- LLM responses shared by all workers, keyed by sha256 of
+-- (system prompt, user prompt, model, temperature) (llm_utils.cached_completion)
+create table if not exists prompt_cache (
+    key text primary key,
+    response text not null,
+    created_at timestamptz not null default now()
+);
@@ -0,0 +1,151 @@
+"""
+Library of hand-curated Manim scripts for stock animations.
+
+Each template in templates/templates.json points at a script with a
+single-line PARAMS dict (the same convention the program cache uses). A
+prompt whose embedding is close enough to a template's description renders
+that script with parameters extracted from the prompt, skipping code
+generation. Like the other caches this needs sentence-transformers for
+embeddings and is a no-op without it.
+"""
+import ast
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from llm_cache import embed
+from program_cache import fill_template, parse_params
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+TEMPLATE_THRESHOLD = 0.95
+
+# Limits on extracted parameters, so a template is only used with values it can render
+MAX_SORT_VALUES = 12
+MAX_MATRIX_SIZE = 4
+_HEX_COLOR_RE = re.compile(r'^#[0-9a-fA-F]{6}$')
+
+ParamCheck = Callable[[Dict[str, Any]], bool]
+
+
+def _is_matrix(value: List[List[float]]) -> bool:
+    return (
+        0 < len(value) <= MAX_MATRIX_SIZE
+        and 0 < len(value[0]) <= MAX_MATRIX_SIZE
+        and all(len(row) == len(value[0]) for row in value)
+    )
+
+
+# Functions and constants a graphed expression may use; keep in sync with
+# NAMESPACE in templates/function_graph.py
+MATH_NAMES = frozenset({
+    "sin", "cos", "tan", "arcsin", "arccos", "arctan", "sinh", "cosh", "tanh",
+    "exp", "log", "log2", "log10", "sqrt", "abs", "floor", "ceil", "pi", "e",
+})
+# Plain arithmetic only: no attributes, subscripts, lambdas or comprehensions
+_EXPRESSION_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Constant, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+)
+
+
+def _check_function_graph(params: Dict[str, Any]) -> bool:
+    try:
+        tree = ast.parse(params["function"].replace("^", "**"), mode="eval")
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if not isinstance(node, _EXPRESSION_NODES):
+            return False
+        if isinstance(node, ast.Name) and node.id != "x" and node.id not in MATH_NAMES:
+            return False
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in MATH_NAMES):
+            return False
+        if isinstance(node, ast.Call) and node.keywords:
+            return False
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            return False
+    return params["x_min"] < params["x_max"] and bool(_HEX_COLOR_RE.match(params["color"]))
+
+
+def _check_matrix_multiplication(params: Dict[str, Any]) -> bool:
+    a, b = params["matrix_a"], params["matrix_b"]
+    return _is_matrix(a) and _is_matrix(b) and len(a[0]) == len(b)
+
+
+def _check_bubble_sort(params: Dict[str, Any]) -> bool:
+    return 2 <= len(params["values"]) <= MAX_SORT_VALUES and bool(_HEX_COLOR_RE.match(params["color"]))
+
+
+# Checks beyond matching the types of the defaults, by template_id
+PARAM_CHECKS: Dict[str, ParamCheck] = {
+    "function_graph": _check_function_graph,
+    "matrix_multiplication": _check_matrix_multiplication,
+    "bubble_sort": _check_bubble_sort,
+}
+
+
+class TemplateLibrary:
+    """Curated templates indexed by the embedding of their descriptions"""
+
+    def __init__(self, directory: str = TEMPLATES_DIR, threshold: float = TEMPLATE_THRESHOLD):
+        self.directory = directory
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # Loaded on first use: [(template_id, code, param_schema, check)] and their embeddings
+        self._templates: Optional[List[Tuple[str, str, Dict[str, Any], Optional[ParamCheck]]]] = None
+        self._embeddings: Optional[np.ndarray] = None
+
+    def _load(self) -> None:
+        with open(os.path.join(self.directory, "templates.json"), encoding="utf-8") as f:
+            index = json.load(f)
+        templates, descriptions = [], []
+        for entry in index:
+            with open(os.path.join(self.directory, entry["file"]), encoding="utf-8") as f:
+                code = f.read()
+            param_schema = parse_params(code)
+            if param_schema is None:
+                logger.warning("Template %s has no PARAMS line, skipping", entry["template_id"])
+                continue
+            template_id = f"{entry['template_id']}@v{entry['version']}"
+            templates.append((template_id, code, param_schema, PARAM_CHECKS.get(entry["template_id"])))
+            descriptions.append(entry["description"])
+        embeddings = [embed(description) for description in descriptions]
+        self._templates = templates
+        self._embeddings = np.stack(embeddings) if embeddings and embeddings[0] is not None else None
+
+    def _best_match(self, prompt: str) -> Optional[Tuple[str, str, Dict[str, Any], Optional[ParamCheck]]]:
+        with self._lock:
+            if self._templates is None:
+                self._load()
+        if self._embeddings is None:
+            return None
+        embedding = embed(prompt)
+        if embedding is None:
+            return None
+        similarities = self._embeddings @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return self._templates[best]
+
+    async def lookup(self, prompt: str) -> Optional[Tuple[str, str]]:
+        """Return (template_id, ready-to-render code) for a prompt matching a template, if any"""
+        try:
+            match = await asyncio.to_thread(self._best_match, prompt)
+            if match is None:
+                return None
+            template_id, template, param_schema, check = match
+            code = await fill_template(template, param_schema, prompt, check)
+            return (template_id, code) if code is not None else None
+        except Exception as e:
+            logger.warning("Template lookup failed: %s", e)
+            return None
+
+
+template_library = TemplateLibrary()
@@ -0,0 +1,42 @@
+from manim import *
+
+PARAMS = {"values": [5, 2, 8, 1, 9, 3], "color": "#58C4DD"}
+
+VALUES = [float(v) for v in PARAMS["values"]] or [1.0]
+
+
+class BubbleSortScene(Scene):
+    def construct(self):
+        title = Text("Bubble Sort", font_size=40).to_edge(UP)
+        scale = 4.5 / max(max(abs(v) for v in VALUES), 1e-9)
+        width = min(0.8, 10 / len(VALUES))
+
+        bars = VGroup(*[
+            VGroup(
+                Rectangle(width=width, height=max(abs(v) * scale, 0.05), color=PARAMS["color"], fill_opacity=0.7),
+                Text(f"{v:g}", font_size=22),
+            )
+            for v in VALUES
+        ])
+        for bar in bars:
+            bar[1].next_to(bar[0], DOWN, buff=0.1)
+        bars.arrange(RIGHT, buff=0.2, aligned_edge=DOWN).to_edge(DOWN, buff=0.8)
+
+        self.play(Write(title))
+        self.play(FadeIn(bars))
+
+        values, order = list(VALUES), list(bars)
+        for end in range(len(values) - 1, 0, -1):
+            for i in range(end):
+                left, right = order[i], order[i + 1]
+                self.play(left[0].animate.set_color(YELLOW), right[0].animate.set_color(YELLOW), run_time=0.25)
+                if values[i] > values[i + 1]:
+                    # Swap the two bars in place
+                    shift = right.get_x() - left.get_x()
+                    self.play(left.animate.shift(RIGHT * shift), right.animate.shift(LEFT * shift), run_time=0.4)
+                    values[i], values[i + 1] = values[i + 1], values[i]
+                    order[i], order[i + 1] = right, left
+                self.play(order[i][0].animate.set_color(PARAMS["color"]), order[i + 1][0].animate.set_color(PARAMS["color"]), run_time=0.15)
+            self.play(order[end][0].animate.set_color(GREEN), run_time=0.15)
+        self.play(order[0][0].animate.set_color(GREEN), run_time=0.15)
+        self.wait(1)
@@ -0,0 +1,50 @@
+from manim import *
+
+PARAMS = {"function": "x**2", "x_min": -3, "x_max": 3, "color": "#58C4DD"}
+
+# Only these math functions and constants are usable in the expression;
+# builtins are cut off so the expression cannot reach anything else
+EXPRESSION = str(PARAMS["function"]).replace("^", "**")
+NAMESPACE = {
+    "__builtins__": {},
+    **{
+        name: getattr(np, name)
+        for name in (
+            "sin", "cos", "tan", "arcsin", "arccos", "arctan", "sinh", "cosh", "tanh",
+            "exp", "log", "log2", "log10", "sqrt", "abs", "floor", "ceil", "pi", "e",
+        )
+    },
+}
+
+
+def f(x):
+    return float(eval(EXPRESSION, NAMESPACE, {"x": x}))
+
+
+class FunctionGraphScene(Scene):
+    def construct(self):
+        x_min, x_max = float(PARAMS["x_min"]), float(PARAMS["x_max"])
+        if x_max <= x_min:
+            x_min, x_max = -3.0, 3.0
+
+        # Fit the y axis to the sampled function values
+        ys = [f(x) for x in np.linspace(x_min, x_max, 200)]
+        ys = [y for y in ys if np.isfinite(y)] or [0.0]
+        y_min, y_max = np.floor(min(ys)), np.ceil(max(ys))
+        if y_max - y_min < 2:
+            y_min, y_max = y_min - 1, y_max + 1
+
+        axes = Axes(
+            x_range=[x_min, x_max, max(1, round((x_max - x_min) / 8))],
+            y_range=[y_min, y_max, max(1, round((y_max - y_min) / 6))],
+            x_length=10,
+            y_length=5.5,
+            tips=False,
+        ).to_edge(DOWN)
+        graph = axes.plot(f, x_range=[x_min, x_max], color=PARAMS["color"])
+        title = Text(f"y = {PARAMS['function']}", font_size=36).to_edge(UP)
+
+        self.play(Write(title))
+        self.play(Create(axes))
+        self.play(Create(graph), run_time=2)
+        self.wait(1)
@@ -0,0 +1,42 @@
+from manim import *
+
+PARAMS = {"matrix_a": [[1, 2], [3, 4]], "matrix_b": [[5, 6], [7, 8]]}
+
+A = PARAMS["matrix_a"]
+B = PARAMS["matrix_b"]
+C = [[sum(A[i][k] * B[k][j] for k in range(len(B))) for j in range(len(B[0]))] for i in range(len(A))]
+
+
+def grid(values, color):
+    """Matrix drawn as a grid of labelled cells (no LaTeX needed)"""
+    cells = VGroup(*[
+        VGroup(Square(side_length=0.8, color=color), Text(str(value), font_size=26))
+        for row in values for value in row
+    ])
+    cells.arrange_in_grid(rows=len(values), cols=len(values[0]), buff=0.05)
+    return cells
+
+
+class MatrixMultiplicationScene(Scene):
+    def construct(self):
+        title = Text("Matrix Multiplication", font_size=40).to_edge(UP)
+        a, b, c = grid(A, BLUE), grid(B, GREEN), grid(C, YELLOW)
+        times, equals = Text("×", font_size=40), Text("=", font_size=40)
+        equation = VGroup(a, times, b, equals, c).arrange(RIGHT, buff=0.4)
+        if equation.width > config.frame_width - 1:
+            equation.scale_to_fit_width(config.frame_width - 1)
+
+        self.play(Write(title))
+        self.play(FadeIn(a), FadeIn(times), FadeIn(b), FadeIn(equals))
+
+        cols_a, cols_b = len(A[0]), len(B[0])
+        for i in range(len(A)):
+            for j in range(cols_b):
+                # Highlight row i of A and column j of B, then reveal C[i][j]
+                row = VGroup(*[a[i * cols_a + k][0] for k in range(cols_a)])
+                col = VGroup(*[b[k * cols_b + j][0] for k in range(len(B))])
+                self.play(row.animate.set_fill(BLUE, 0.4), col.animate.set_fill(GREEN, 0.4), run_time=0.4)
+                self.play(FadeIn(c[i * cols_b + j]), run_time=0.4)
+                self.play(row.animate.set_fill(opacity=0), col.animate.set_fill(opacity=0), run_time=0.2)
+
+        self.wait(1)